@@ -3,8 +3,14 @@ import pandas as pd
 import math
 import io
 import datetime
+import os
+import tempfile
+import zipfile
 from PIL import Image
 
+from importacao import consolidar_bases
+from exportacao import preparar_para_parquet, serializar_df, serializar_em_paralelo
+
 # =============================================================================
 # CONFIGURAÇÕES GERAIS
 # =============================================================================
@@ -41,6 +47,14 @@ if "df_base_tratada" not in st.session_state:
     st.session_state.df_base_tratada = None
 if "resultado_rateio" not in st.session_state:
     st.session_state.resultado_rateio = None
+if "base_particionada" not in st.session_state:
+    st.session_state.base_particionada = None
+if "pacote_lojas" not in st.session_state:
+    st.session_state.pacote_lojas = None
+if "excel_saida" not in st.session_state:
+    st.session_state.excel_saida = None
+if "resultado_completo" not in st.session_state:
+    st.session_state.resultado_completo = None
 
 # =============================================================================
 # MODELO EXCEL
@@ -122,35 +136,124 @@ st.markdown("---")
 # =============================================================================
 st.header("3️⃣ Importar Planilha")
 
-arquivo = st.file_uploader("Selecione o arquivo base (.xlsx):", type=["xlsx"])
+def rotulo_comprador(serie):
+    return serie.fillna('N/A').astype(str)
 
-if arquivo is not None and st.button("📥 Salvar"):
+def gravar_base_particionada(df_base, por_loja):
+    # Um arquivo Parquet por Comprador (ou por Comprador + Loja) em diretório temporário.
+    # O TemporaryDirectory fica na sessão: o diretório é apagado quando a sessão é
+    # descartada (ou o servidor encerra), além de em descartar_base_particionada()
+    pasta = tempfile.TemporaryDirectory(prefix="rateio_base_")
     try:
-        with st.spinner("Importando base..."):
-            df_base = pd.read_excel(arquivo, sheet_name="Base")
+        return escrever_particoes(pasta, df_base, por_loja)
+    except Exception:
+        pasta.cleanup()
+        raise
+
+def escrever_particoes(pasta, df_base, por_loja):
+    df = preparar_para_parquet(df_base)
+    df['_Comprador'] = rotulo_comprador(df['Comprador'])
+    chaves_arquivo = ['_Comprador', 'Loja'] if por_loja else ['_Comprador']
+
+    estatisticas = []
+    for i, (_, df_part) in enumerate(df.groupby(chaves_arquivo, sort=True, dropna=False)):
+        nome_arquivo = f"part_{i:05d}.parquet"
+        df_part.drop(columns=['_Comprador']).to_parquet(
+            os.path.join(pasta.name, nome_arquivo), index=False
+        )
 
-            for col in ['Quantidade Disponível', 'Qtd. Pend. Ped.Compra', 'Média Vda/Dia']:
-                df_base[col] = pd.to_numeric(df_base[col], errors='coerce').fillna(0)
+        # Estatísticas sempre no nível Comprador/Loja para permitir o filtro por loja
+        stats = (
+            df_part.groupby(['_Comprador', 'Loja'], as_index=False, dropna=False)
+            .agg(
+                Linhas=('Código Produto', 'size'),
+                Produtos=('Código Produto', 'nunique'),
+                Estoque=('Quantidade Disponível', 'sum'),
+                Venda=('Média Vda/Dia', 'sum')
+            )
+            .rename(columns={
+                '_Comprador': 'Comprador',
+                'Estoque': 'Quantidade Disponível',
+                'Venda': 'Média Vda/Dia'
+            })
+        )
+        stats['Arquivo'] = nome_arquivo
+        estatisticas.append(stats)
 
-            df_base['Loja'] = df_base['Loja'].astype(str)
+    if estatisticas:
+        manifesto = pd.concat(estatisticas, ignore_index=True)
+    else:
+        manifesto = pd.DataFrame(columns=[
+            'Comprador', 'Loja', 'Linhas', 'Produtos',
+            'Quantidade Disponível', 'Média Vda/Dia', 'Arquivo'
+        ])
+    return {
+        "pasta": pasta,
+        "diretorio": pasta.name,
+        "manifesto": manifesto,
+        "colunas": df_base.columns.tolist(),
+        "por_loja": por_loja
+    }
+
+def descartar_base_particionada():
+    base = st.session_state.base_particionada
+    if base is not None:
+        base["pasta"].cleanup()
+    st.session_state.base_particionada = None
+
+arquivos = st.file_uploader(
+    "Selecione o(s) arquivo(s) base (.xlsx):",
+    type=["xlsx"],
+    accept_multiple_files=True
+)
 
-            if 'Comprador' not in df_base.columns:
-                df_base['Comprador'] = 'N/A'
-            if 'Cto. Bruto Unitário' not in df_base.columns:
-                df_base['Cto. Bruto Unitário'] = 0.0
+particionar = st.checkbox(
+    "💾 Armazenar base particionada em disco por Comprador (carrega só o que for selecionado)",
+    value=False
+)
+particionar_loja = st.checkbox(
+    "Particionar também por Loja",
+    value=False,
+    disabled=not particionar
+)
 
-            st.session_state.df_base = df_base
-            st.session_state.df_base_tratada = df_base.copy()
+if arquivos and st.button("📥 Salvar"):
+    try:
+        with st.spinner("Importando base..."):
+            df_base, df_conflitos = consolidar_bases(
+                [(a.name, a.getvalue()) for a in arquivos]
+            )
 
-        st.success("Base importada com sucesso!")
+            # A base anterior só é descartada depois que a nova foi gravada
+            if particionar:
+                nova_base = gravar_base_particionada(df_base, particionar_loja)
+                descartar_base_particionada()
+                st.session_state.base_particionada = nova_base
+                st.session_state.df_base = None
+                st.session_state.df_base_tratada = None
+            else:
+                descartar_base_particionada()
+                st.session_state.df_base = df_base
+                st.session_state.df_base_tratada = df_base.copy()
+
+        st.success(f"Base importada com sucesso! ({len(arquivos)} arquivo(s), {len(df_base)} linhas)")
+        if not df_conflitos.empty:
+            st.warning(
+                f"{len(df_conflitos)} combinação(ões) Loja/Código Produto com valores diferentes entre arquivos. "
+                "Foram mantidas as linhas do primeiro arquivo enviado."
+            )
+            st.dataframe(df_conflitos, use_container_width=True, hide_index=True)
     except Exception as e:
         st.error(f"Erro ao ler a base: {e}")
         st.stop()
 
-if st.session_state.df_base_tratada is None:
+if st.session_state.df_base_tratada is None and st.session_state.base_particionada is None:
     st.stop()
 
-df_base = st.session_state.df_base_tratada.copy()
+if st.session_state.base_particionada is not None:
+    with st.expander("📊 Partições da base"):
+        st.dataframe(st.session_state.base_particionada["manifesto"], use_container_width=True, hide_index=True)
+
 st.markdown("---")
 
 # =============================================================================
@@ -164,7 +267,20 @@ modalidade = st.radio(
     horizontal=True
 )
 
-todas_lojas = sorted(df_base['Loja'].dropna().unique().tolist())
+if st.session_state.base_particionada is not None:
+    manifesto = st.session_state.base_particionada["manifesto"]
+    todos_compradores = sorted(manifesto['Comprador'].unique().tolist())
+    todas_lojas = sorted(manifesto['Loja'].dropna().unique().tolist())
+else:
+    df_base_memoria = st.session_state.df_base_tratada
+    todos_compradores = sorted(rotulo_comprador(df_base_memoria['Comprador']).unique().tolist())
+    todas_lojas = sorted(df_base_memoria['Loja'].dropna().unique().tolist())
+
+compradores_sel = st.multiselect(
+    "Compradores:",
+    options=todos_compradores,
+    default=todos_compradores
+)
 
 col_saida, col_entrada = st.columns(2)
 
@@ -194,8 +310,30 @@ with col_entrada:
             default=[l for l in todas_lojas if l not in lojas_saida]
         )
 
-df_saida = df_base[df_base["Loja"].isin(lojas_saida)].copy().reset_index(drop=True)
-df_entrada = df_base[df_base["Loja"].isin(lojas_entrada)].copy().reset_index(drop=True)
+# Cache por seleção (uma entrada = uma seleção completa de partições). Como é
+# compartilhado entre todas as sessões, fica limitado em tamanho e tempo
+@st.cache_data(show_spinner=False, max_entries=4, ttl=1800)
+def ler_particoes(diretorio, arquivos):
+    # O pyarrow já paraleliza internamente a leitura de cada arquivo
+    partes = [pd.read_parquet(os.path.join(diretorio, a)) for a in arquivos]
+    return pd.concat(partes, ignore_index=True)
+
+def carregar_base(compradores, lojas):
+    base = st.session_state.base_particionada
+    if base is not None:
+        # Filtro aplicado no manifesto: só os arquivos necessários são lidos do disco
+        manifesto = base["manifesto"]
+        selecao = manifesto[manifesto['Comprador'].isin(compradores) & manifesto['Loja'].isin(lojas)]
+        arquivos = tuple(sorted(selecao['Arquivo'].unique()))
+        if not arquivos:
+            return pd.DataFrame(columns=base["colunas"])
+        df = ler_particoes(base["diretorio"], arquivos)
+        df['Loja'] = df['Loja'].astype(str)
+    else:
+        df = st.session_state.df_base_tratada.copy()
+
+    df = df[rotulo_comprador(df['Comprador']).isin(compradores) & df['Loja'].isin(lojas)]
+    return df.reset_index(drop=True)
 
 # =============================================================================
 # FUNÇÕES AUXILIARES (ORIGINAIS)
@@ -229,6 +367,12 @@ st.header("5️⃣ Calcular Transferências")
 
 if st.button("🚀 Calcular Transferências"):
     with st.spinner("Processando rateio..."):
+        # A base (ou as partições selecionadas) só é carregada ao calcular
+        df_base = carregar_base(compradores_sel, sorted(set(lojas_saida) | set(lojas_entrada)))
+
+        df_saida = df_base[df_base["Loja"].isin(lojas_saida)].copy().reset_index(drop=True)
+        df_entrada = df_base[df_base["Loja"].isin(lojas_entrada)].copy().reset_index(drop=True)
+
         df_saida_proc = calcular_liberado_para_transferir(
             df_saida,
             st.session_state.minimo_saida,
@@ -302,7 +446,7 @@ if st.button("🚀 Calcular Transferências"):
         # =======================
         # CÁLCULO DOS VALORES
         # =======================
-        df_base_local = st.session_state.df_base_tratada.copy()
+        df_base_local = df_base.copy()
 
         map_custo = df_base_local.set_index(
             ['Loja', 'Código Produto']
@@ -386,6 +530,9 @@ if st.button("🚀 Calcular Transferências"):
             "df_valor_por_loja_entrada": df_valor_por_loja_entrada,
             "df_parametros": df_parametros
         }
+        st.session_state.pacote_lojas = None
+        st.session_state.excel_saida = None
+        st.session_state.resultado_completo = None
 
 
 
@@ -703,13 +850,130 @@ if st.session_state.resultado_rateio is not None:
         output.seek(0)
         return output
 
-    excel_saida = gerar_excel_saida()
     data_atual = datetime.datetime.now().strftime("%Y%m%d_%H%M%S")
-    nome_arquivo = f"Rateio_Loja_a_Loja_{data_atual}.xlsx"
 
-    st.download_button(
-        label="📤 Baixar resultado em Excel",
-        data=excel_saida,
-        file_name=nome_arquivo,
-        mime="application/vnd.openxmlformats-officedocument.spreadsheetml.sheet"
-    )
+    # O Excel é gerado sob demanda para não ser refeito a cada interação na tela
+    if st.button("📊 Gerar resultado em Excel"):
+        try:
+            with st.spinner("Gerando Excel..."):
+                st.session_state.excel_saida = {
+                    "arquivo": gerar_excel_saida(),
+                    "nome": f"Rateio_Loja_a_Loja_{data_atual}.xlsx"
+                }
+        except Exception as e:
+            st.error(f"Erro ao gerar o Excel: {e}")
+
+    if st.session_state.excel_saida is not None:
+        st.download_button(
+            label="📤 Baixar resultado em Excel",
+            data=st.session_state.excel_saida["arquivo"],
+            file_name=st.session_state.excel_saida["nome"],
+            mime="application/vnd.openxmlformats-officedocument.spreadsheetml.sheet"
+        )
+
+    # =============================================================================
+    # EXPORTAÇÃO POR LOJA (UM ARQUIVO POR LOJA, EM ZIP)
+    # =============================================================================
+    FORMATOS_EXPORTACAO = {
+        "Excel (.xlsx)": "xlsx",
+        "CSV (.csv)": "csv",
+        "Parquet (.parquet)": "parquet"
+    }
+
+    def ordenar_por_codigo(df):
+        # Código Produto é texto: ordena pelo valor numérico, com o texto como desempate
+        return (
+            df.assign(_Codigo_Num=pd.to_numeric(df["Código Produto"], errors="coerce"))
+            .sort_values(["_Codigo_Num", "Código Produto"], na_position="last")
+            .drop(columns="_Codigo_Num")
+            .reset_index(drop=True)
+        )
+
+    def gerar_zip_por_loja(rateio_ll, colunas_particao, formato):
+        # Monta a lista de arquivos (um por loja) antes de serializar
+        tarefas = []
+        for col_loja in colunas_particao:
+            pasta = "Saida" if col_loja == "Loja Saída" else "Entrada"
+            for loja, df_loja in rateio_ll.groupby(col_loja, sort=True):
+                nome_loja = str(loja).replace("/", "_").replace("\\", "_")
+                df_loja = ordenar_por_codigo(df_loja)
+                tarefas.append((f"{pasta}/Loja_{nome_loja}.{formato}", df_loja))
+
+        # Serializa os arquivos das lojas em paralelo
+        conteudos = serializar_em_paralelo([df_loja for _, df_loja in tarefas], formato)
+
+        output = io.BytesIO()
+        with zipfile.ZipFile(output, "w", compression=zipfile.ZIP_DEFLATED) as zf:
+            for (nome, _), conteudo in zip(tarefas, conteudos):
+                zf.writestr(nome, conteudo)
+        output.seek(0)
+        return output
+
+    if res["rateio_ll"] is not None and not res["rateio_ll"].empty:
+        st.markdown("---")
+        st.subheader("📦 Exportação por Loja")
+
+        col_part, col_fmt = st.columns(2)
+        with col_part:
+            particao = st.radio(
+                "Separar arquivos por:",
+                ["Loja Saída", "Loja Entrada", "Ambas"],
+                horizontal=True
+            )
+        with col_fmt:
+            rotulo_formato = st.radio(
+                "Formato dos arquivos:",
+                list(FORMATOS_EXPORTACAO.keys()),
+                horizontal=True
+            )
+        formato = FORMATOS_EXPORTACAO[rotulo_formato]
+        colunas_particao = ["Loja Saída", "Loja Entrada"] if particao == "Ambas" else [particao]
+
+        if st.button("🗂️ Gerar arquivos por loja"):
+            try:
+                with st.spinner("Gerando arquivos por loja..."):
+                    st.session_state.pacote_lojas = {
+                        "zip": gerar_zip_por_loja(res["rateio_ll"], colunas_particao, formato),
+                        "particao": particao,
+                        "formato": formato
+                    }
+            except Exception as e:
+                st.error(f"Erro ao gerar arquivos por loja: {e}")
+
+        pacote = st.session_state.pacote_lojas
+        if pacote is not None:
+            nome_zip = f"Rateio_Por_Loja_{pacote['particao'].replace(' ', '_')}_{data_atual}.zip"
+            st.download_button(
+                label=f"📤 Baixar arquivos por loja ({pacote['formato']}, .zip)",
+                data=pacote["zip"],
+                file_name=nome_zip,
+                mime="application/zip"
+            )
+
+        # Resultado completo em formato leve (para rodadas grandes, onde o Excel pesa)
+        rotulo_completo = st.radio(
+            "Formato do resultado completo:",
+            ["CSV (.csv)", "Parquet (.parquet)"],
+            horizontal=True
+        )
+        formato_completo = FORMATOS_EXPORTACAO[rotulo_completo]
+
+        if st.button("🗃️ Gerar resultado completo"):
+            try:
+                with st.spinner("Gerando resultado completo..."):
+                    st.session_state.resultado_completo = {
+                        "arquivo": serializar_df(res["rateio_ll"], formato_completo),
+                        "formato": formato_completo,
+                        "nome": f"Rateio_Loja_a_Loja_{data_atual}.{formato_completo}"
+                    }
+            except Exception as e:
+                st.error(f"Erro ao gerar o resultado completo: {e}")
+
+        completo = st.session_state.resultado_completo
+        if completo is not None:
+            st.download_button(
+                label=f"📤 Baixar Rateio Loja a Loja completo (.{completo['formato']})",
+                data=completo["arquivo"],
+                file_name=completo["nome"],
+                mime="text/csv" if completo["formato"] == "csv" else "application/octet-stream"
+            )
@@ -0,0 +1,64 @@
+import io
+import multiprocessing
+import os
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+from itertools import repeat
+
+import pandas as pd
+from pandas.api.types import is_object_dtype
+
+# =============================================================================
+# SERIALIZAÇÃO DOS RESULTADOS
+# =============================================================================
+# Funções em módulo próprio para poderem rodar em processos separados:
+# xlsxwriter e to_csv são Python puro e não paralelizam com threads.
+
+
+# Colunas descritivas que podem misturar números e strings vindas do Excel.
+# As numéricas (quantidades, custo) já são convertidas na importação.
+COLUNAS_TEXTO = [
+    'Loja', 'Código Produto', 'Produto', 'Embal', 'Comprador',
+    'Loja Saída', 'Loja Entrada'
+]
+
+
+def preparar_para_parquet(df):
+    # O Parquet exige um tipo único por coluna: as colunas descritivas mistas
+    # (ex.: Código Produto, Embal) são gravadas como texto
+    df = df.copy()
+    for col in COLUNAS_TEXTO:
+        if col in df.columns and is_object_dtype(df[col]):
+            df[col] = df[col].where(df[col].isna(), df[col].astype(str))
+    return df
+
+
+def serializar_df(df, formato, sheet_name="Rateio"):
+    buffer = io.BytesIO()
+    if formato == "xlsx":
+        with pd.ExcelWriter(buffer, engine="xlsxwriter") as writer:
+            df.to_excel(writer, sheet_name=sheet_name, index=False)
+    elif formato == "csv":
+        df.to_csv(buffer, index=False, sep=";", decimal=",", encoding="utf-8-sig")
+    else:
+        preparar_para_parquet(df).to_parquet(buffer, index=False)
+    return buffer.getvalue()
+
+
+def serializar_em_paralelo(dfs, formato):
+    # Parquet: o pyarrow libera o GIL, então threads bastam
+    if formato == "parquet":
+        with ThreadPoolExecutor() as executor:
+            return list(executor.map(serializar_df, dfs, repeat(formato)))
+
+    if len(dfs) <= 1:
+        return [serializar_df(df, formato) for df in dfs]
+
+    # xlsx/csv: processos iniciados com "spawn" (fork dentro do servidor
+    # multi-thread do Streamlit pode travar)
+    max_workers = min(len(dfs), os.cpu_count() or 1)
+    chunksize = max(1, len(dfs) // (max_workers * 4))
+    with ProcessPoolExecutor(
+        max_workers=max_workers,
+        mp_context=multiprocessing.get_context("spawn")
+    ) as executor:
+        return list(executor.map(serializar_df, dfs, repeat(formato), chunksize=chunksize))
@@ -0,0 +1,95 @@
+import io
+import multiprocessing
+import os
+from concurrent.futures import ProcessPoolExecutor
+
+import pandas as pd
+
+# =============================================================================
+# IMPORTAÇÃO DA BASE
+# =============================================================================
+# Funções em módulo próprio para poderem rodar em processos separados:
+# a leitura do xlsx (openpyxl) é Python puro e não paraleliza com threads.
+
+CHAVE_BASE = ['Loja', 'Código Produto']
+
+
+def normalizar_codigo(serie):
+    # 123, 123.0 e "123" viram o mesmo código em texto; códigos alfanuméricos ficam como estão
+    numerico = pd.to_numeric(serie, errors='coerce')
+    inteiro = numerico.notna() & (numerico % 1 == 0)
+    texto = serie.astype(str).str.strip()
+    # Formatação direta (sem cast para int64, que estoura em silêncio em códigos longos)
+    texto[inteiro] = numerico[inteiro].map('{:.0f}'.format)
+    return texto.where(serie.notna(), None)
+
+
+def ler_base(nome, conteudo):
+    df = pd.read_excel(io.BytesIO(conteudo), sheet_name="Base")
+
+    for col in ['Quantidade Disponível', 'Qtd. Pend. Ped.Compra', 'Média Vda/Dia']:
+        df[col] = pd.to_numeric(df[col], errors='coerce').fillna(0)
+
+    df['Loja'] = normalizar_codigo(df['Loja'])
+    df['Código Produto'] = normalizar_codigo(df['Código Produto'])
+
+    if 'Comprador' not in df.columns:
+        df['Comprador'] = 'N/A'
+    if 'Cto. Bruto Unitário' not in df.columns:
+        df['Cto. Bruto Unitário'] = 0.0
+    df['Cto. Bruto Unitário'] = pd.to_numeric(df['Cto. Bruto Unitário'], errors='coerce').fillna(0)
+
+    df['Arquivo Origem'] = nome
+    return df
+
+
+def ler_bases(arquivos):
+    # arquivos: lista de (nome, bytes), na ordem de upload
+    if len(arquivos) == 1:
+        return [ler_base(*arquivos[0])]
+
+    nomes, conteudos = zip(*arquivos)
+    max_workers = min(len(arquivos), os.cpu_count() or 1)
+    # "spawn" evita fork dentro do servidor multi-thread do Streamlit
+    with ProcessPoolExecutor(
+        max_workers=max_workers,
+        mp_context=multiprocessing.get_context("spawn")
+    ) as executor:
+        return list(executor.map(ler_base, nomes, conteudos))
+
+
+def consolidar_bases(arquivos):
+    bases = ler_bases(arquivos)
+    df_todas = pd.concat(bases, ignore_index=True)
+    df_todas['_Ordem'] = pd.concat(
+        [pd.Series(i, index=range(len(b))) for i, b in enumerate(bases)],
+        ignore_index=True
+    )
+
+    grupos = df_todas.groupby(CHAVE_BASE, dropna=False)['_Ordem']
+
+    # Deduplicação determinística: para cada Loja/Produto prevalecem as linhas do
+    # primeiro arquivo enviado em que a chave aparece (repetições dentro dele são mantidas)
+    df_base = (
+        df_todas[df_todas['_Ordem'] == grupos.transform('min')]
+        .drop(columns=['Arquivo Origem', '_Ordem'])
+        .reset_index(drop=True)
+    )
+
+    # Conflitos: chave presente em mais de um arquivo com valores diferentes
+    entre_arquivos = df_todas[grupos.transform('nunique') > 1]
+    colunas_valor = [c for c in df_todas.columns if c not in CHAVE_BASE + ['Arquivo Origem', '_Ordem']]
+    distintos = entre_arquivos.drop_duplicates(CHAVE_BASE + colunas_valor)
+    chaves_conflito = distintos[distintos.duplicated(CHAVE_BASE, keep=False)][CHAVE_BASE].drop_duplicates()
+
+    df_conflitos = (
+        entre_arquivos.merge(chaves_conflito, on=CHAVE_BASE)
+        .sort_values('_Ordem', kind='stable')
+        .groupby(CHAVE_BASE, as_index=False, dropna=False)
+        .agg(
+            Arquivos=('Arquivo Origem', lambda x: ', '.join(dict.fromkeys(x.astype(str)))),
+            Mantido=('Arquivo Origem', 'first')
+        )
+        .rename(columns={'Mantido': 'Arquivo Mantido'})
+    )
+    return df_base, df_conflitos